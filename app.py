@@ -1,5 +1,5 @@
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, send_file, Response, stream_with_context
 from authlib.integrations.flask_client import OAuth
 from jose import jwt
 from urllib.request import urlopen
@@ -12,6 +12,11 @@ import authlib.jose.errors
 import requests
 from io import BytesIO
 import re
+import tempfile
+import threading
+import unicodedata
+import uuid
+import zipfile
 from pdf2image import convert_from_path
 import sqlitecloud
 import google.generativeai as genai
@@ -82,6 +87,63 @@ def generate_pdf(title, content):
     pdf.output(pdf_file)
     return pdf_file
 
+def image_suffix(response):
+    # FPDF picks the image parser from the file extension
+    content_type = response.headers.get('Content-Type', '')
+    if 'png' in content_type:
+        return '.png'
+    if 'gif' in content_type:
+        return '.gif'
+    return '.jpg'
+
+def pdf_text(text):
+    """Make text safe for FPDF's core fonts, which only encode latin-1.
+
+    Other characters lose their accents (ț -> t, ș -> s, ă -> a) or become '?',
+    so a single character can't make pdf.output fail for the whole document.
+    """
+    chars = []
+    for char in text:
+        try:
+            char.encode('latin-1')
+        except UnicodeEncodeError:
+            char = ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c))
+            char = char.encode('latin-1', 'replace').decode('latin-1') or '?'
+        chars.append(char)
+    return ''.join(chars)
+
+def write_lesson_content(pdf, content, image_files, image_dir):
+    """Write lesson text and [img] lines to the pdf.
+
+    image_files maps image URLs to downloaded files (or None if the download
+    failed), so an image shared by several lessons is fetched and embedded once.
+    """
+    for line in content.split("\n"):
+        if line.startswith("[img]"):
+            img_url = line.replace("[img]", "").strip()
+            if img_url not in image_files:
+                try:
+                    response = requests.get(img_url, timeout=10)
+                    if response.status_code == 200:
+                        image_path = os.path.join(image_dir, f"image_{len(image_files)}{image_suffix(response)}")
+                        with open(image_path, 'wb') as f:
+                            f.write(response.content)
+                        image_files[img_url] = image_path
+                    else:
+                        image_files[img_url] = None
+                except Exception as e:
+                    image_files[img_url] = None
+
+            if image_files[img_url] is None:
+                pdf.multi_cell(0, 10, pdf_text(f"[Image Failed to Load: {img_url}]"))
+                continue
+            try:
+                pdf.image(image_files[img_url], x=10, w=170)
+            except Exception as e:
+                pdf.multi_cell(0, 10, pdf_text(f"[Invalid Image URL: {img_url}]"))
+        else:
+            pdf.multi_cell(0, 10, pdf_text(line))
+
 def get_jwks():
     url = f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'
     response = urlopen(url)
@@ -137,6 +199,23 @@ def init_db():
     # Create other tables
     db.execute('''CREATE TABLE IF NOT EXISTS lessons (id INTEGER PRIMARY KEY, title TEXT, content TEXT, grade INTEGER)''')
     db.execute('''CREATE TABLE IF NOT EXISTS feedback (id INTEGER PRIMARY KEY, message TEXT, email TEXT)''')
+
+    # Bumped on every change to a grade's lessons; course bundles are cached per version
+    db.execute('''CREATE TABLE IF NOT EXISTS lesson_versions (grade INTEGER PRIMARY KEY, version INTEGER)''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS lessons_version_insert AFTER INSERT ON lessons BEGIN
+                    INSERT INTO lesson_versions (grade, version) VALUES (NEW.grade, 1)
+                    ON CONFLICT (grade) DO UPDATE SET version = version + 1;
+                  END''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS lessons_version_update AFTER UPDATE ON lessons BEGIN
+                    INSERT INTO lesson_versions (grade, version) VALUES (OLD.grade, 1)
+                    ON CONFLICT (grade) DO UPDATE SET version = version + 1;
+                    INSERT INTO lesson_versions (grade, version) VALUES (NEW.grade, 1)
+                    ON CONFLICT (grade) DO UPDATE SET version = version + 1;
+                  END''')
+    db.execute('''CREATE TRIGGER IF NOT EXISTS lessons_version_delete AFTER DELETE ON lessons BEGIN
+                    INSERT INTO lesson_versions (grade, version) VALUES (OLD.grade, 1)
+                    ON CONFLICT (grade) DO UPDATE SET version = version + 1;
+                  END''')
     
     # Create interactive lessons table
     db.execute('''CREATE TABLE IF NOT EXISTS interactive_lessons (
@@ -156,6 +235,18 @@ def init_db():
                     total_questions INTEGER,
                     completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (lesson_id) REFERENCES interactive_lessons (id))''')
+
+    # Quiz analytics rollups, kept up to date by submit_quiz and rebuilt by backfill_quiz_analytics
+    db.execute('''CREATE TABLE IF NOT EXISTS quiz_score_counts (
+                    lesson_id INTEGER,
+                    score INTEGER,
+                    attempts INTEGER,
+                    PRIMARY KEY (lesson_id, score))''')
+    db.execute('''CREATE TABLE IF NOT EXISTS quiz_daily_completions (
+                    lesson_id INTEGER,
+                    day TEXT,
+                    completions INTEGER,
+                    PRIMARY KEY (lesson_id, day))''')
        
 def get_db():
     connection_string = 'sqlitecloud://cl7vyaxhhz.g4.sqlite.cloud:8860/database.db?apikey=jnNrwbq16JcWWEWJcmTn25I5Nz1kMlbgovCQBvbPf3k'
@@ -163,6 +254,362 @@ def get_db():
     db.row_factory = sqlitecloud.Row  # This is similar to sqlite3's Row factory
     return db
 
+# Background jobs (bulk import etc.), kept in memory and polled by the admin pages
+jobs = {}
+jobs_lock = threading.RLock()
+
+def start_job(kind, target, *args, **fields):
+    job_id = uuid.uuid4().hex
+    with jobs_lock:
+        jobs[job_id] = dict({'id': job_id, 'kind': kind, 'status': 'queued', 'processed': 0,
+                             'total': None, 'errors': [], 'result': None}, **fields)
+
+    def run():
+        update_job(job_id, status='running')
+        try:
+            target(job_id, *args)
+            # A target may have set its own final status (e.g. an outdated course bundle)
+            with jobs_lock:
+                if jobs[job_id]['status'] == 'running':
+                    jobs[job_id]['status'] = 'done'
+        except Exception as e:
+            print(f"Error in {kind} job {job_id}: {str(e)}")
+            update_job(job_id, status='failed', error=str(e))
+
+    threading.Thread(target=run, daemon=True).start()
+    return job_id
+
+def update_job(job_id, **fields):
+    with jobs_lock:
+        jobs[job_id].update(fields)
+
+def get_job(job_id):
+    with jobs_lock:
+        job = jobs.get(job_id)
+        return dict(job, errors=list(job['errors'])) if job else None
+
+# Bulk import / export of lessons, interactive lessons and simulations
+IMPORT_BATCH_SIZE = 200
+EXPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 50
+
+IMPORT_TABLES = {
+    'lesson': ('lessons', ('title', 'content', 'grade')),
+    'interactive_lesson': ('interactive_lessons', ('title', 'content', 'grade', 'cad_file_url', 'quiz_questions')),
+    'simulation': ('simulations', ('title', 'link', 'description', 'solution_link', 'grade')),
+}
+
+def validate_quiz_questions(value):
+    """Normalize quiz questions to the {'questions': [...]} JSON stored by add_interactive_lesson"""
+    if value is None:
+        value = []
+    if isinstance(value, str):
+        value = json.loads(value) if value.strip() else []
+    if isinstance(value, dict):
+        value = value.get('questions', [])
+    if not isinstance(value, list):
+        raise ValueError('quiz_questions must be a list')
+
+    questions = []
+    for i, item in enumerate(value):
+        if not isinstance(item, dict) or not isinstance(item.get('question'), str) or not item['question']:
+            raise ValueError(f'quiz question {i + 1} has no question text')
+        options = item.get('options', [])
+        if not isinstance(options, list) or not all(isinstance(option, str) for option in options):
+            raise ValueError(f'quiz question {i + 1} options must be a list of strings')
+        options = [option for option in options if option][:4]
+        if len(options) < 2:
+            raise ValueError(f'quiz question {i + 1} needs at least 2 options')
+        correct_answer = int(item.get('correct_answer', 0))
+        if not 0 <= correct_answer < len(options):
+            raise ValueError(f'quiz question {i + 1} has an invalid correct_answer')
+        questions.append({'question': item['question'], 'options': options, 'correct_answer': correct_answer})
+    return json.dumps({'questions': questions})
+
+def import_text(record, field, required=True):
+    value = record.get(field)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f'{field} is required')
+        return ''
+    if not isinstance(value, str):
+        raise ValueError(f'{field} must be a string')
+    return value
+
+def validate_import_record(record):
+    """Return (record type, row tuple) for one import record or raise ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError('record must be a JSON object')
+    kind = record.get('type')
+    if kind not in IMPORT_TABLES:
+        raise ValueError(f'unknown record type: {kind!r}')
+
+    title = import_text(record, 'title').strip()
+    if not title:
+        raise ValueError('title is required')
+    grade = record.get('grade', 8 if kind == 'simulation' else None)
+    # int() would quietly turn true into 1 and 5.9 into 5
+    if isinstance(grade, bool) or (isinstance(grade, float) and not grade.is_integer()):
+        raise ValueError('grade must be an integer')
+    try:
+        grade = int(grade)
+    except (TypeError, ValueError):
+        raise ValueError('grade must be an integer')
+
+    if kind == 'lesson':
+        return kind, (title, import_text(record, 'content'), grade)
+    if kind == 'interactive_lesson':
+        content = import_text(record, 'content')
+        cad_file_url = import_text(record, 'cad_file_url', required=False)
+        quiz_json = validate_quiz_questions(record.get('quiz_questions'))
+        return kind, (title, content, grade, cad_file_url, quiz_json)
+
+    link = import_text(record, 'link')
+    description = import_text(record, 'description')
+    solution_link = import_text(record, 'solution_link', required=False)
+    return kind, (title, link, description, solution_link, grade)
+
+def iter_import_lines(path, filename):
+    """Yield (source, line number, raw line) from a JSONL file or every .jsonl member of a ZIP"""
+    if filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if not member.lower().endswith('.jsonl'):
+                    continue
+                with archive.open(member) as f:
+                    for line_no, line in enumerate(f, start=1):
+                        yield member, line_no, line
+    else:
+        with open(path, 'rb') as f:
+            for line_no, line in enumerate(f, start=1):
+                yield filename, line_no, line
+
+def insert_batch(db, kind, rows):
+    table, columns = IMPORT_TABLES[kind]
+    placeholders = ', '.join('?' for _ in columns)
+    db.execute('BEGIN TRANSACTION')
+    try:
+        db.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+        db.execute('COMMIT')
+    except Exception:
+        db.execute('ROLLBACK')
+        raise
+
+def run_bulk_import(job_id, path, filename):
+    """Import a JSONL/ZIP upload in batches.
+
+    Every committed batch stays committed if the job fails later on, so the job
+    status keeps the rows inserted per type and the line the import stopped at.
+    Retrying the whole file after a failure would insert those rows again.
+    """
+    db = get_db()
+    batches = {kind: [] for kind in IMPORT_TABLES}
+    inserted_by_type = {kind: 0 for kind in IMPORT_TABLES}
+    processed = inserted = 0
+    errors = []
+    position = None
+
+    def flush(kind):
+        nonlocal inserted
+        if batches[kind]:
+            insert_batch(db, kind, batches[kind])
+            inserted += len(batches[kind])
+            inserted_by_type[kind] += len(batches[kind])
+            batches[kind] = []
+
+    try:
+        for source, line_no, line in iter_import_lines(path, filename):
+            position = f'{source}:{line_no}'
+            if not line.strip():
+                continue
+            processed += 1
+            try:
+                kind, row = validate_import_record(json.loads(line))
+            except (ValueError, TypeError) as e:  # json.JSONDecodeError is a ValueError too
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f'{source}:{line_no}: {str(e)}')
+                continue
+
+            batches[kind].append(row)
+            if len(batches[kind]) >= IMPORT_BATCH_SIZE:
+                flush(kind)
+                update_job(job_id, processed=processed, inserted=inserted, errors=list(errors))
+
+        for kind in batches:
+            position = 'end of file'
+            flush(kind)
+    except Exception:
+        update_job(job_id, stopped_at=position)
+        raise
+    finally:
+        update_job(job_id, processed=processed, inserted=inserted, inserted_by_type=dict(inserted_by_type),
+                   errors=list(errors))
+        os.remove(path)
+
+def iter_export_rows(db, table, columns):
+    """Page through a table by primary key so the whole table is never held in memory"""
+    last_id = 0
+    while True:
+        rows = db.execute(f"SELECT id, {', '.join(columns)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+                          (last_id, EXPORT_BATCH_SIZE)).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        last_id = rows[-1][0]
+
+def export_records(kinds):
+    db = get_db()
+    for kind in kinds:
+        table, columns = IMPORT_TABLES[kind]
+        for row in iter_export_rows(db, table, columns):
+            record = {'type': kind}
+            record.update((column, row[i + 1]) for i, column in enumerate(columns))
+            if kind == 'interactive_lesson':
+                try:
+                    record['quiz_questions'] = json.loads(record['quiz_questions'] or '{}').get('questions', [])
+                except json.JSONDecodeError:
+                    record['quiz_questions'] = []
+            yield json.dumps(record, ensure_ascii=False) + '\n'
+
+# Admin dashboard: feedback pages and per-lesson quiz analytics
+FEEDBACK_PAGE_SIZE = 50
+QUIZ_MAX_SCORE = 10
+ANALYTICS_DAYS = 14
+
+def record_quiz_result(db, lesson_id, user_email, score, total_questions):
+    """Store a quiz result and update the analytics rollups in the same transaction"""
+    db.execute('BEGIN TRANSACTION')
+    try:
+        db.execute("INSERT INTO quiz_results (lesson_id, user_email, score, total_questions) VALUES (?, ?, ?, ?)",
+                   (lesson_id, user_email, score, total_questions))
+        db.execute('''INSERT INTO quiz_score_counts (lesson_id, score, attempts) VALUES (?, ?, 1)
+                      ON CONFLICT (lesson_id, score) DO UPDATE SET attempts = attempts + 1''',
+                   (lesson_id, score))
+        db.execute('''INSERT INTO quiz_daily_completions (lesson_id, day, completions) VALUES (?, DATE('now'), 1)
+                      ON CONFLICT (lesson_id, day) DO UPDATE SET completions = completions + 1''',
+                   (lesson_id,))
+        db.execute('COMMIT')
+    except Exception:
+        db.execute('ROLLBACK')
+        raise
+
+def backfill_quiz_analytics(job_id):
+    """Rebuild the analytics rollups from every row in quiz_results"""
+    db = get_db()
+    db.execute('BEGIN TRANSACTION')
+    try:
+        db.execute("DELETE FROM quiz_score_counts")
+        db.execute("DELETE FROM quiz_daily_completions")
+        # Older results were stored unvalidated; leave out any score that isn't an integer
+        db.execute('''INSERT INTO quiz_score_counts (lesson_id, score, attempts)
+                      SELECT lesson_id, score, COUNT(*) FROM quiz_results
+                      WHERE typeof(score) = 'integer'
+                      GROUP BY lesson_id, score''')
+        db.execute('''INSERT INTO quiz_daily_completions (lesson_id, day, completions)
+                      SELECT lesson_id, DATE(completed_at), COUNT(*) FROM quiz_results
+                      WHERE typeof(score) = 'integer'
+                      GROUP BY lesson_id, DATE(completed_at)''')
+        db.execute('COMMIT')
+    except Exception:
+        db.execute('ROLLBACK')
+        raise
+
+    attempts = db.execute("SELECT COALESCE(SUM(attempts), 0) FROM quiz_score_counts").fetchone()[0]
+    update_job(job_id, processed=attempts, total=attempts)
+
+def median_from_counts(score_counts):
+    """Median of a list of (score, attempts) pairs sorted by score"""
+    attempts = sum(count for _, count in score_counts)
+    middle = [(attempts - 1) // 2, attempts // 2]
+    values = []
+    seen = 0
+    for score, count in score_counts:
+        while middle and middle[0] < seen + count:
+            values.append(score)
+            middle.pop(0)
+        seen += count
+    return sum(values) / len(values) if values else 0
+
+def load_quiz_analytics(db):
+    """Per-lesson attempts, mean and median score, and completions for the last ANALYTICS_DAYS days"""
+    analytics = {}
+    rows = db.execute('''SELECT s.lesson_id, il.title, s.score, s.attempts
+                         FROM quiz_score_counts s
+                         JOIN interactive_lessons il ON s.lesson_id = il.id
+                         WHERE typeof(s.score) = 'integer'
+                         ORDER BY s.lesson_id, s.score''').fetchall()
+    for row in rows:
+        lesson = analytics.setdefault(row[0], {'lesson_id': row[0], 'title': row[1],
+                                               'score_counts': [], 'daily': []})
+        lesson['score_counts'].append((row[2], row[3]))
+
+    for lesson in analytics.values():
+        lesson['attempts'] = sum(count for _, count in lesson['score_counts'])
+        lesson['mean_score'] = sum(score * count for score, count in lesson['score_counts']) / lesson['attempts']
+        lesson['median_score'] = median_from_counts(lesson['score_counts'])
+
+    daily = db.execute('''SELECT lesson_id, day, completions FROM quiz_daily_completions
+                          WHERE day >= DATE('now', ?) ORDER BY day DESC''',
+                       (f'-{ANALYTICS_DAYS - 1} days',)).fetchall()
+    for row in daily:
+        if row[0] in analytics:
+            analytics[row[0]]['daily'].append((row[1], row[2]))
+
+    return sorted(analytics.values(), key=lambda lesson: lesson['attempts'], reverse=True)
+
+# Per-grade course bundles: every lesson of a grade in one PDF, built in the background
+BUNDLE_DIR = os.path.join(tempfile.gettempdir(), 'rookielab_bundles')
+bundle_jobs = {}
+
+def lesson_bundle_signature(db, grade):
+    """Version of a grade's lessons, bumped by the lessons_version_* triggers on every insert, update and delete"""
+    row = db.execute("SELECT version FROM lesson_versions WHERE grade = ?", (grade,)).fetchone()
+    return f"v{row[0] if row else 0}"
+
+def bundle_path(grade, signature):
+    return os.path.join(BUNDLE_DIR, f"grade_{grade}_{signature}.pdf")
+
+def build_course_bundle(job_id, grade, signature):
+    db = get_db()
+    lessons = db.execute("SELECT id, title, content FROM lessons WHERE grade = ? ORDER BY id", (grade,)).fetchall()
+    update_job(job_id, total=len(lessons))
+
+    # One document for the whole course: fonts and images are embedded once
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    image_files = {}
+    with tempfile.TemporaryDirectory() as image_dir:
+        for index, lesson in enumerate(lessons):
+            pdf.add_page()
+            pdf.set_font("Arial", 'B', 18)
+            pdf.multi_cell(0, 12, pdf_text(lesson[1]))
+            pdf.set_font("Arial", size=14)
+            write_lesson_content(pdf, lesson[2], image_files, image_dir)
+            update_job(job_id, processed=index + 1)
+
+        os.makedirs(BUNDLE_DIR, exist_ok=True)
+        path = bundle_path(grade, signature)
+        pdf.output(path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    # Drop bundles that don't match the current version of this grade's lessons. That can
+    # include this one if a lesson changed mid-build, but never a newer build.
+    current = bundle_path(grade, lesson_bundle_signature(db, grade))
+    for name in os.listdir(BUNDLE_DIR):
+        stale = os.path.join(BUNDLE_DIR, name)
+        if name.startswith(f"grade_{grade}_") and name.endswith('.pdf') and stale != current:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+    if path != current:
+        # A lesson changed mid-build and the file was just removed; the page asks for a fresh build
+        update_job(job_id, status='outdated')
+        return
+    update_job(job_id, result=os.path.basename(path))
+
 @app.route('/')
 def home():
     return render_template('home.html')
@@ -230,9 +677,21 @@ def admin():
         flash('Interactive lesson uploaded successfully!')
     
     db = get_db()
-    feedback = db.execute("SELECT * FROM feedback").fetchall()
 
-    return render_template('admin.html', is_admin=session.get('is_admin', False), feedback=feedback)
+    # Page through feedback newest first by id, so deep pages cost the same as the first one
+    before = request.args.get('before', type=int)
+    if before:
+        feedback = db.execute("SELECT * FROM feedback WHERE id < ? ORDER BY id DESC LIMIT ?",
+                              (before, FEEDBACK_PAGE_SIZE + 1)).fetchall()
+    else:
+        feedback = db.execute("SELECT * FROM feedback ORDER BY id DESC LIMIT ?", (FEEDBACK_PAGE_SIZE + 1,)).fetchall()
+    older_feedback = feedback[FEEDBACK_PAGE_SIZE - 1][0] if len(feedback) > FEEDBACK_PAGE_SIZE else None
+    feedback = feedback[:FEEDBACK_PAGE_SIZE]
+
+    quiz_analytics = load_quiz_analytics(db)
+
+    return render_template('admin.html', is_admin=session.get('is_admin', False), feedback=feedback,
+                           older_feedback=older_feedback, quiz_analytics=quiz_analytics)
 
 
 @app.route('/simulari')
@@ -326,6 +785,55 @@ def add_interactive_lesson():
     # Render template with interactive lessons
     return render_template('admin_interactive_lessons.html', interactive_lessons=interactive_lessons, is_admin=session.get('is_admin', False))
 
+@app.route('/admin/import', methods=['POST'])
+def bulk_import():
+    if 'user' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename.lower().endswith(('.jsonl', '.zip')):
+        return jsonify({'error': 'Upload a .jsonl or .zip file'}), 400
+
+    # Spool the upload to disk so the import job can stream it after the request ends
+    suffix = os.path.splitext(upload.filename)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        upload.save(tmp)
+
+    job_id = start_job('import', run_bulk_import, tmp.name, upload.filename, inserted=0)
+    return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/admin/export')
+def bulk_export():
+    if 'user' not in session or not session.get('is_admin'):
+        flash("You don't have permission to access this page.")
+        return redirect(url_for('home'))
+
+    kind = request.args.get('type')
+    if kind and kind not in IMPORT_TABLES:
+        return jsonify({'error': f'Unknown export type: {kind}'}), 400
+    kinds = [kind] if kind else list(IMPORT_TABLES)
+
+    return Response(stream_with_context(export_records(kinds)), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f"attachment; filename=rookielab_{kind or 'all'}.jsonl"})
+
+@app.route('/admin/analytics/backfill', methods=['POST'])
+def backfill_analytics():
+    if 'user' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    job_id = start_job('analytics_backfill', backfill_quiz_analytics)
+    return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/admin/jobs/<job_id>')
+def job_status(job_id):
+    if 'user' not in session or not session.get('is_admin'):
+        return jsonify({'error': 'Admin access required'}), 403
+
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 @app.route('/lessons/<int:lesson_id>')
 def view_lesson(lesson_id):
     db = get_db()
@@ -350,36 +858,70 @@ def generate_lesson_pdf(lesson_id):
     pdf.add_page()
     pdf.set_font("Arial", size=14)
     
-    lines = lesson[2].split("\n")
-    for line in lines:
-        if line.startswith("[img]"):
-            img_url = line.replace("[img]", "").strip()
-            try:
-                response = requests.get(img_url)
-                if response.status_code == 200:
-                    import tempfile
-                    with tempfile.NamedTemporaryFile(suffix='.jpg') as tmp:
-                        tmp.write(response.content)
-                        tmp.flush()
-                        pdf.image(tmp.name, x=10, w=170)
-                else:
-                    pdf.multi_cell(0, 10, f"[Image Failed to Load: {img_url}]")
-            except Exception as e:
-                pdf.multi_cell(0, 10, f"[Invalid Image URL: {img_url}]")
-        else:
-            pdf.multi_cell(0, 10, line)
+    with tempfile.TemporaryDirectory() as image_dir:
+        write_lesson_content(pdf, lesson[2], {}, image_dir)
 
-    import tempfile
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
-        pdf.output(tmp.name)
-        buffer = BytesIO()
-        with open(tmp.name, 'rb') as f:
-            buffer.write(f.read())
-        buffer.seek(0)
-        os.remove(tmp.name)
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp:
+            pdf.output(tmp.name)
+            buffer = BytesIO()
+            with open(tmp.name, 'rb') as f:
+                buffer.write(f.read())
+            buffer.seek(0)
+            os.remove(tmp.name)
 
     return send_file(buffer, as_attachment=True, download_name=f"lecția_{lesson[1]}.pdf", mimetype='application/pdf')
 
+@app.route('/lessons/bundle/<int:grade>', methods=['POST'])
+def request_course_bundle(grade):
+    if 'user' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    db = get_db()
+    if db.execute("SELECT 1 FROM lessons WHERE grade = ? LIMIT 1", (grade,)).fetchone() is None:
+        return jsonify({'error': 'No lessons available for this department'}), 404
+    signature = lesson_bundle_signature(db, grade)
+
+    if os.path.exists(bundle_path(grade, signature)):
+        return jsonify({'status': 'done', 'download_url': url_for('download_course_bundle', grade=grade)})
+
+    # Share one build between everyone asking for the same version of a course
+    with jobs_lock:
+        job_id = bundle_jobs.get((grade, signature))
+        # The bundle file is missing at this point, so a finished job has to run again too
+        if job_id is not None and jobs[job_id]['status'] in ('done', 'failed'):
+            job_id = None
+        if job_id is None:
+            job_id = start_job('bundle', build_course_bundle, grade, signature, grade=grade)
+            bundle_jobs[(grade, signature)] = job_id
+
+    return jsonify({'status': 'queued', 'job_id': job_id,
+                    'status_url': url_for('course_bundle_status', job_id=job_id)}), 202
+
+@app.route('/lessons/bundle/jobs/<job_id>')
+def course_bundle_status(job_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    job = get_job(job_id)
+    if job is None or job['kind'] != 'bundle':
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] == 'done':
+        job['download_url'] = url_for('download_course_bundle', grade=job['grade'])
+    return jsonify(job)
+
+@app.route('/lessons/bundle/<int:grade>/pdf')
+def download_course_bundle(grade):
+    if 'user' not in session:
+        flash("Trebuie să fiți autentificat pentru a descărca PDF-ul.")
+        return redirect(url_for('login'))
+
+    db = get_db()
+    path = bundle_path(grade, lesson_bundle_signature(db, grade))
+    if not os.path.exists(path):
+        return "The course PDF is out of date or has not been built yet.", 404
+
+    return send_file(path, as_attachment=True, download_name=f"curs_{grade}.pdf", mimetype='application/pdf')
+
 @app.route('/lessons', methods=['GET'])
 def lessons():
     grade = request.args.get('grade', type=int)  # Get the grade from the query parameter
@@ -391,7 +933,7 @@ def lessons():
         # Fetch all lessons if no grade is provided
         lessons = db.execute("SELECT id, title, SUBSTR(content, 1, 500) AS content, grade FROM lessons ORDER BY id DESC").fetchall()
     
-    return render_template('lessons.html', lessons=lessons)
+    return render_template('lessons.html', lessons=lessons, grade=grade)
 
 @app.route('/simulare/<int:simul_id>')
 def simulare_view(simul_id):
@@ -540,13 +1082,23 @@ def submit_quiz():
     
     if not all([lesson_id, score is not None, total_questions]):
         return jsonify({'error': 'Missing required data'}), 400
+
+    # The score becomes part of the analytics rollup key, so only accept sane integers.
+    # The quiz page sends the score out of QUIZ_MAX_SCORE, whatever the number of questions.
+    try:
+        lesson_id = int(lesson_id)
+        score = int(score)
+        total_questions = int(total_questions)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid quiz data'}), 400
+    if not 0 <= score <= QUIZ_MAX_SCORE or total_questions < 1:
+        return jsonify({'error': 'Invalid quiz data'}), 400
     
     db = get_db()
     user_email = session['user'].get('email', 'unknown')
     
     # Store quiz result
-    db.execute("INSERT INTO quiz_results (lesson_id, user_email, score, total_questions) VALUES (?, ?, ?, ?)", 
-               (lesson_id, user_email, score, total_questions))
+    record_quiz_result(db, lesson_id, user_email, score, total_questions)
     
     return jsonify({'success': True, 'score': score})
 